@@ -1,6 +1,122 @@
-from satsolver import solve_sat
+from satsolver import solve_clauses
+from collections import OrderedDict
+from itertools import chain
 import argparse
+import io
 import sys
+import threading
+
+class _InfeasibleILP(Exception):
+    """Raised while encoding as soon as a constraint can never be satisfied."""
+
+def _ladder_clauses(weights, lits, cbase):
+    """
+    Returns the s_ij ladder clauses of a constraint as a tuple, where
+    weights[i-1] >= 0 is the weight of variable lits[i-1] (x_i or z_i).
+    The s_ij variable for this constraint is cbase + i * (max_sum + 1) + j.
+    The ladder does not depend on the bound, so when the same rows are
+    encoded again (e.g. a branch-and-bound loop that only changes b) a
+    cached copy can be reused as is.
+    """
+    stride = sum(weights) + 1
+    clauses = []
+    clauses_append = clauses.append
+    clauses_extend = clauses.extend
+
+    # Base cases for i=0
+    clauses_append((cbase,))  # s_00 = true
+    clauses_extend([(-j,) for j in range(cbase + 1, cbase + stride)])  # s_0j = false
+
+    # Generate clauses for each variable in this constraint
+    for i, w_i, var_i in zip(range(1, len(weights) + 1), weights, lits):
+        # s_ij variables of rows i and i-1, hoisted out of the j loop
+        row = cbase + i * stride
+        cur_row = range(row, row + stride)
+        prev_row = range(row - stride, row)
+
+        # Case 1: j < w_i, weight too large, can't include this variable
+        for s_ij, s_prev_j in zip(cur_row[:w_i], prev_row[:w_i]):
+            clauses_extend(((-s_ij, s_prev_j),
+                            (-s_ij, -var_i),
+                            (-s_prev_j, var_i, s_ij)))
+
+        # Case 2: j >= w_i, can choose to include this variable or not
+        for s_ij, s_prev_j, s_prev_j_minus_w in zip(cur_row[w_i:], prev_row[w_i:], prev_row):
+            clauses_extend(((-s_ij, s_prev_j, s_prev_j_minus_w),
+                            (-s_ij, s_prev_j, var_i),
+                            (-s_ij, -var_i, s_prev_j_minus_w),
+                            (-s_prev_j, var_i, s_ij),
+                            (-s_prev_j_minus_w, -var_i, s_ij)))
+
+    return tuple(clauses)
+
+class _LadderCache:
+    """
+    LRU cache of ladders keyed on (weights, lits, cbase), bounded by the total
+    number of clauses it holds rather than by entries, since keeping hundreds
+    of thousands of clause tuples alive slows down every garbage collection
+    pass. Ladders bigger than the whole budget are never stored.
+    Safe to share between threads that encode concurrently.
+    """
+
+    def __init__(self, max_clauses):
+        self.max_clauses = max_clauses
+        self.num_clauses = 0
+        self.ladders = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, weights, lits, cbase):
+        key = (tuple(weights), tuple(lits), cbase)
+        with self.lock:
+            ladder = self.ladders.get(key)
+            if ladder is not None:
+                self.ladders.move_to_end(key)
+                return ladder
+
+        # Build outside the lock so other threads are not held up meanwhile
+        ladder = _ladder_clauses(weights, lits, cbase)
+        if len(ladder) <= self.max_clauses:
+            with self.lock:
+                if key not in self.ladders:  # another thread may have stored it first
+                    self.ladders[key] = ladder
+                    self.num_clauses += len(ladder)
+                while self.num_clauses > self.max_clauses and self.ladders:
+                    _, evicted = self.ladders.popitem(last=False)
+                    self.num_clauses -= len(evicted)
+        return ladder
+
+    def clear(self):
+        with self.lock:
+            self.ladders.clear()
+            self.num_clauses = 0
+
+_ladder_cache = _LadderCache(max_clauses=50_000)
+
+def clear_ladder_cache():
+    """Drop the s_ij ladders cached for re-encoding repeated constraint rows."""
+    _ladder_cache.clear()
+
+def _emit_constraint_clauses(weights, lits, bound, geq, max_sum, cbase, num_vars, clauses):
+    """
+    Appends the clauses for a single normalized constraint to clauses:
+    the s_ij ladder (cached when small) followed by the bounding clauses.
+    """
+    if geq and bound > max_sum:
+        # this case is always infeasible, so stop encoding right away
+        raise _InfeasibleILP
+
+    stride = max_sum + 1
+    clauses.extend(_ladder_cache.get(weights, lits, cbase))
+
+    # Add bounding constraint:
+    last_row = cbase + num_vars * stride
+    if not geq:
+        # need sum <= bound, so introduce ¬s_nk for k > bound (multiple clauses)
+        clauses.extend([(-k,) for k in range(last_row + bound + 1, last_row + stride)])
+    else:  # geq case
+        # need sum >= bound, so at least one of s_nk for k >= bound must be true (one clause)
+        at_least_one = tuple(range(last_row + bound, last_row + stride))
+        clauses.append(at_least_one)
 
 def encode_ilp_to_sat(A, b):
     """
@@ -10,17 +126,32 @@ def encode_ilp_to_sat(A, b):
     - All variables are binary
     - b[i] >= 0 for all i
 
-    Returns a list of clauses in CNF form.
+    Returns (clauses, total_vars): a list of clauses in CNF form, each clause a
+    tuple of literals (tuples are noticeably smaller than lists for these 1-5
+    literal clauses), and the number of SAT variables used.
     Variable numbering:
     1 to n: original x_i variables
     n+1 to 2n: corresponding z_i variables (complements)
     Rest: s_ij variables for each constraint
     """
-    if not A or not A[0]:
-        return []
+    try:
+        return _encode_ilp_to_sat(A, b, len(A[0]) if A else 0)
+    except _InfeasibleILP:
+        # some constraint is always infeasible, so just make it UNSAT via p AND ¬p
+        return [(1,), (-1,)], 1
+
+def _encode_ilp_to_sat(A, b, num_vars):
+    """
+    encode_ilp_to_sat for an A with num_vars columns, but raises
+    _InfeasibleILP for trivially infeasible systems.
+    """
+    if num_vars == 0:
+        # with no variables every row reads 0 <= b[i]
+        if any(bound < 0 for bound in b):
+            raise _InfeasibleILP
+        return [], 0
 
     num_constraints = len(A)
-    num_vars = len(A[0])
     clauses = []
 
     # First, add clauses for complementary variables
@@ -29,18 +160,11 @@ def encode_ilp_to_sat(A, b):
     for i in range(num_vars):
         x_i = i + 1
         z_i = x_i + num_vars
-        clauses.append([-x_i, -z_i])  # can't both be true
-        clauses.append([x_i, z_i])    # can't both be false
+        clauses.append((-x_i, -z_i))  # can't both be true
+        clauses.append((x_i, z_i))    # can't both be false
 
     # Base index for s_ij variables starts after all x_i and z_i variables
-    base_s_idx = 2 * num_vars + 1
-
-    def get_s_idx(constraint_num, i, j):
-        """Get variable number for s_ij in the given constraint"""
-        # For each constraint, we need (num_vars + 1) * (max_sum + 1) s_ij variables
-        max_sum = sum(abs(coef) for coef in A[constraint_num])
-        offset = constraint_num * (num_vars + 1) * (max_sum + 1)
-        return base_s_idx + offset + i * (max_sum + 1) + j
+    next_s_idx = 2 * num_vars + 1
 
     # Handle each constraint separately
     for constraint_num in range(num_constraints):
@@ -49,114 +173,99 @@ def encode_ilp_to_sat(A, b):
 
         # First check if bound is negative, then flip it
         # This might create negative coefficients so flip it before handling negatives
-        geq = False
-        if bound < 0:
+        geq = bound < 0
+        if geq:
             bound = -bound
-            coeffs = [-c for c in coeffs]
-            geq = True
 
-        # Now handle negative coefficients
+        # Now handle negative coefficients in the same pass: c * x_i = |c| * z_i - |c|,
+        # so weigh z_i by |c| instead and adjust the bound
+        weights = [0] * num_vars
+        lits = [0] * num_vars
         for i, coeff in enumerate(coeffs):
+            if geq:
+                coeff = -coeff
             if coeff < 0:
-                bound += abs(coeff) # adjust the bound
-                coeffs[i] = abs(coeff)
-
-        max_sum = sum(abs(coef) for coef in coeffs)
-
-        # Base cases for i=0
-        clauses.append([get_s_idx(constraint_num, 0, 0)])  # s_00 = true
-        for j in range(1, max_sum + 1):
-            clauses.append([-get_s_idx(constraint_num, 0, j)])  # s_0j = false
-
-        # Generate clauses for each variable in this constraint
-        for i in range(1, num_vars + 1):
-            w_i = abs(coeffs[i-1])  # Use absolute value of coefficient
-            # Choose x_i or z_i based on coefficient sign
-            var_i = i if coeffs[i-1] >= 0 else (i + num_vars)
-
-            for j in range(max_sum + 1):
-                s_ij = get_s_idx(constraint_num, i, j)
-                s_prev_j = get_s_idx(constraint_num, i-1, j)
-
-                if w_i > j:
-                    # Case 1: weight too large, can't include this variable
-                    clauses.append([-s_ij, s_prev_j])
-                    clauses.append([-s_ij, -var_i])
-                    clauses.append([-s_prev_j, var_i, s_ij])
-                else:
-                    # Case 2: can choose to include this variable or not
-                    s_prev_j_minus_w = get_s_idx(constraint_num, i-1, j - w_i)
-                    clauses.append([-s_ij, s_prev_j, s_prev_j_minus_w])
-                    clauses.append([-s_ij, s_prev_j, var_i])
-                    clauses.append([-s_ij, -var_i, s_prev_j_minus_w])
-                    clauses.append([-s_prev_j, var_i, s_ij])
-                    clauses.append([-s_prev_j_minus_w, -var_i, s_ij])
-
-        # Add bounding constraint:
-        if not geq:
-            # need sum <= bound, so introduce ¬s_nk for k > bound (multiple clauses)
-            for k in range(bound + 1, max_sum + 1):
-                clauses.append([-get_s_idx(constraint_num, num_vars, k)])
-        else:  # geq case
-            if bound > max_sum:
-                # this case is always infeasible
-                # so just make it UNSAT via p AND ¬p
-                clauses.append([1])
-                clauses.append([-1])
+                bound -= coeff
+                weights[i] = -coeff
+                lits[i] = i + 1 + num_vars  # z_i
             else:
-                # need sum >= bound, so at least one of s_nk for k >= bound must be true (one clause)
-                at_least_one = [get_s_idx(constraint_num, num_vars, k)
-                                for k in range(bound, max_sum + 1)]
-                clauses.append(at_least_one)
+                weights[i] = coeff
+                lits[i] = i + 1  # x_i
 
-    return clauses
+        max_sum = sum(weights)
 
-def clauses_to_dimacs(clauses, num_vars) -> str:
-    """Convert clauses to DIMACS CNF format string."""
-    lines = []
+        # Every assignment already satisfies sum <= bound, so no clauses are needed.
+        # (A >= constraint always has bound >= 1 here, so it is never trivially true.)
+        if not geq and max_sum <= bound:
+            continue
+
+        # For each constraint, we need (num_vars + 1) * (max_sum + 1) s_ij variables,
+        # laid out back to back so that constraints never share s_ij variables
+        cbase = next_s_idx
+        next_s_idx += (num_vars + 1) * (max_sum + 1)
+        _emit_constraint_clauses(weights, lits, bound, geq, max_sum, cbase, num_vars, clauses)
+
+    # The last constraint's s_ij block ends at the highest variable number
+    total_vars = next_s_idx - 1
+    return clauses, total_vars
+
+def write_dimacs(clauses, num_vars, fileobj):
+    """Stream clauses in DIMACS CNF format to a binary file object."""
+    write = fileobj.write
 
     # Add header
-    lines.append(f"p cnf {num_vars} {len(clauses)}")
+    write(f"p cnf {num_vars} {len(clauses)}\n".encode())
+
+    # Variable numbers repeat across many clauses, so encode each literal once;
+    # literals beyond num_vars fall back to str()
+    pos = [str(var).encode() for var in range(num_vars + 1)]
+    neg = [b"-" + lit for lit in pos]
+    size = len(pos)
 
-    # Add clauses
+    # Add clauses, each terminated by 0
     for clause in clauses:
-        # Each clause needs to end with 0
-        clause_str = " ".join(str(lit) for lit in clause) + " 0"
-        lines.append(clause_str)
+        write(b" ".join([pos[lit] if 0 < lit < size else
+                         neg[-lit] if 0 < -lit < size else
+                         str(lit).encode() for lit in clause]))
+        write(b" 0\n")
 
-    return "\n".join(lines)
+def clauses_to_dimacs(clauses, num_vars) -> str:
+    """Convert clauses to DIMACS CNF format string."""
+    buf = io.BytesIO()
+    write_dimacs(clauses, num_vars, buf)
+    return buf.getvalue().decode()
 
 def decode_solution(solution, num_vars):
     """
-    Takes a list of positive and negative integers representing a SAT solution
-    and returns the values of the original variables.
+    Takes a dict mapping SAT variable numbers to booleans representing a SAT
+    solution and returns the values of the original variables.
+    Variables missing from the solution are taken to be 0.
     """
-    return {f"x{i+1}": 1 if solution.get(i+1, False) else 0
-            for i in range(num_vars)}
+    get = solution.get
+    return {f"x{i}": 1 if get(i) else 0 for i in range(1, num_vars + 1)}
 
-def solve_ilp(A, b, use_uv: bool = False):
+def solve_ilp(A, b, use_uv: bool = False, backend: str = "pip"):
     """
     Solves a binary ILP system Ax <= b using SAT encoding.
     Returns (is_satisfiable, solution_dict) where solution_dict maps variable names to 0/1 values.
     """
+    num_vars = len(A[0]) if A else 0
 
-    # Get the CNF clauses
-    clauses = encode_ilp_to_sat(A, b)
-
-    # Calculate number of variables
-    num_vars = max(abs(lit) for clause in clauses for lit in clause)
-
-    # Convert to DIMACS format
-    dimacs_str = clauses_to_dimacs(clauses, num_vars)
+    # Get the CNF clauses and total number of SAT variables
+    try:
+        clauses, total_vars = _encode_ilp_to_sat(A, b, num_vars)
+    except _InfeasibleILP:
+        # known to be infeasible without asking the solver
+        return False, None
 
-    # Solve using pipip
-    is_sat, solution = solve_sat(dimacs_str, use_uv=use_uv)
+    # Solve using pipip, handing over the clauses directly rather than via DIMACS
+    is_sat, solution = solve_clauses(total_vars, clauses, use_uv=use_uv, backend=backend)
 
     if not is_sat:
         return False, None
 
     # Extract only the original variables from the solution
-    return True, decode_solution(solution, len(A[0]))
+    return True, decode_solution(solution, num_vars)
 
 def save_dimacs_cnf(filename: str, dimacs_str: str):
     """Saves a DIMACS CNF string to a file."""
@@ -168,27 +277,34 @@ def parse_ilp_file(filename):
     Each line: a1 a2 ... an b
     where a1..an are coefficients and b is the bound.
     Lines starting with 'c' are ignored as comments."""
-    A = []
-    b = []
     with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('c'):  # skip empty lines and comments
-                nums = list(map(int, line.split()))
-                A.append(nums[:-1])  # all but last number are coefficients
-                b.append(nums[-1])   # last number is bound
+        rows = [line.split() for line in f
+                if line.strip() and not line.strip().startswith('c')]  # skip empty lines and comments
+    if not rows:
+        return [], []
+
+    width = len(rows[0])
+    if any(len(row) != width for row in rows):
+        raise ValueError("every constraint must have the same number of coefficients")
+
+    # Convert every token in one pass, then slice the flat list into rows
+    nums = list(map(int, chain.from_iterable(rows)))
+    A = [nums[k:k + width - 1] for k in range(0, len(nums), width)]  # all but last number are coefficients
+    b = nums[width - 1::width]  # last number is bound
     return A, b
 
 def main():
     parser = argparse.ArgumentParser(description='Binary ILP solver using SAT encoding')
     parser.add_argument('input', help='Input ILP file')
     parser.add_argument('--uv', action='store_true', help='Use uv instead of pip-compile')
+    parser.add_argument('--backend', choices=['pip', 'pysat'], default='pip',
+                        help='Solve with pip (default) or directly with pysat')
 
     args = parser.parse_args()
 
     try:
         A, b = parse_ilp_file(args.input)
-        is_feasible, solution = solve_ilp(A, b, use_uv=args.uv)  # Pass the flag
+        is_feasible, solution = solve_ilp(A, b, use_uv=args.uv, backend=args.backend)  # Pass the flag
 
         if is_feasible:
             print("Feasible")
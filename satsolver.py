@@ -1,9 +1,15 @@
 import argparse
-from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, repeat
 from pathlib import Path
+from typing import Optional
+import os
+import re
 import tempfile
+import struct
 import sys
 import subprocess
+import zlib
 
 WHEEL_METADATA = """
 Wheel-Version: 1.0
@@ -11,43 +17,69 @@ Generator: sat-solver (1.0.0)
 Root-Is-Purelib: true
 Tag: py3-none-any
 """.strip()
+WHEEL_BYTES = WHEEL_METADATA.encode()
+WHEEL_CRC = zlib.crc32(WHEEL_BYTES)
+
+# Stored (uncompressed) ZIP records, see the PKWARE APPNOTE. Every wheel has the
+# same three entries, so the archive is assembled directly instead of via ZipFile.
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_ZIP_VERSION = 20
+_DOS_DATE = (1 << 5) | 1  # 1980-01-01, the earliest date ZIP can represent
+
+# Scratch space for the wheels: a RAM-backed tmpfs where there is one (Linux),
+# otherwise the platform's default temp directory (e.g. TEMP on Windows)
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+# Spare blocks to leave for requirements.in/.txt and the directories themselves
+_SCRATCH_HEADROOM_BLOCKS = 256
+
+# DIMACS lines that carry no literals: comments, the problem line and '%'
+_SKIPPED_LINES = re.compile(r"^[ \t]*[cp%].*$", re.MULTILINE)
+
+def _write_wheel(path: Path, dist_info: str, metadata: str):
+    """Write a wheel containing only the METADATA, WHEEL and RECORD files."""
+    metadata_bytes = metadata.encode()
+    entries = (
+        (f"{dist_info}/METADATA".encode(), metadata_bytes, zlib.crc32(metadata_bytes)),
+        (f"{dist_info}/WHEEL".encode(), WHEEL_BYTES, WHEEL_CRC),
+        (f"{dist_info}/RECORD".encode(), b"", 0),
+    )
+
+    local = []
+    central = []
+    offset = 0
+    for name, data, crc in entries:
+        header = _LOCAL_HEADER.pack(b"PK\x03\x04", _ZIP_VERSION, 0, 0, 0, _DOS_DATE,
+                                    crc, len(data), len(data), len(name), 0)
+        local += (header, name, data)
+        central += (_CENTRAL_HEADER.pack(b"PK\x01\x02", _ZIP_VERSION, _ZIP_VERSION, 0, 0, 0, _DOS_DATE,
+                                         crc, len(data), len(data), len(name), 0, 0, 0, 0, 0, offset), name)
+        offset += len(header) + len(name) + len(data)
+
+    central_dir = b"".join(central)
+    end = _END_RECORD.pack(b"PK\x05\x06", 0, 0, len(entries), len(entries), len(central_dir), offset, 0)
+    path.write_bytes(b"".join(local) + central_dir + end)
 
 def create_variable_package(package_dir: Path, var: int, version: float):
     """Create a wheel file for a variable package."""
     name = f"x{var}"
-    filename = f"{name}-{version}-py3-none-any.whl"
+    prefix = f"{name}-{version}"
 
-    with ZipFile(package_dir.joinpath(filename), "w") as writer:
-        metadata = [
-            f"Name: {name}",
-            f"Version: {version}",
-            "Metadata-Version: 2.2"
-        ]
-
-        # Write the metadata files
-        writer.writestr(f"{name}-{version}.dist-info/METADATA", "\n".join(metadata))
-        writer.writestr(f"{name}-{version}.dist-info/WHEEL", WHEEL_METADATA)
-        writer.writestr(f"{name}-{version}.dist-info/RECORD", "")
+    metadata = f"Name: {name}\nVersion: {version}\nMetadata-Version: 2.2"
+    _write_wheel(package_dir.joinpath(f"{prefix}-py3-none-any.whl"), f"{prefix}.dist-info", metadata)
 
 def create_clause_package(package_dir: Path, clause_num: int, version: int, dependencies: list):
     """Create a wheel file for a clause package with dependencies."""
     name = f"c{clause_num}"
-    filename = f"{name}-{version}.0-py3-none-any.whl"
-
-    with ZipFile(package_dir.joinpath(filename), "w") as writer:
-        metadata = [
-            f"Name: {name}",
-            f"Version: {version}.0",
-            "Metadata-Version: 2.2"
-        ]
+    prefix = f"{name}-{version}.0"
 
-        # Add dependencies
-        for dep in dependencies:
-            metadata.append(f"Requires-Dist: {dep}")
+    metadata = f"Name: {name}\nVersion: {version}.0\nMetadata-Version: 2.2"
+    # Add dependencies
+    for dep in dependencies:
+        metadata += f"\nRequires-Dist: {dep}"
 
-        writer.writestr(f"{name}-{version}.0.dist-info/METADATA", "\n".join(metadata))
-        writer.writestr(f"{name}-{version}.0.dist-info/WHEEL", WHEEL_METADATA)
-        writer.writestr(f"{name}-{version}.0.dist-info/RECORD", "")
+    _write_wheel(package_dir.joinpath(f"{prefix}-py3-none-any.whl"), f"{prefix}.dist-info", metadata)
 
 def generate_requirements(num_vars: int, clauses: list) -> str:
     """Generate requirements.in content"""
@@ -63,38 +95,65 @@ def generate_requirements(num_vars: int, clauses: list) -> str:
 
     return '\n'.join(lines)
 
-def generate_packages(num_vars: int, clauses: list, package_dir: Path):
-    """Generate all necessary wheel packages."""
-    package_dir.mkdir(exist_ok=True, parents=True)
-
-    # Create variable packages (version 1.0 for False, 2.0 for True)
-    for var in range(1, num_vars + 1):
+def _write_variable_packages(package_dir: Path, variables):
+    """Create the 1.0 and 2.0 wheels for each of the given variables."""
+    # Version 1.0 for False, 2.0 for True
+    for var in variables:
         create_variable_package(package_dir, var, 1.0)
         create_variable_package(package_dir, var, 2.0)
 
-    # Create clause packages
-    for i, clause in enumerate(clauses, 1):
+def _write_clause_packages(package_dir: Path, numbered_clauses):
+    """Create one wheel per literal for each (clause number, clause) pair."""
+    for i, clause in numbered_clauses:
         for version, lit in enumerate(clause, 1):
             var = abs(lit)
             required_version = "2.0" if lit > 0 else "1.0"
             dependencies = [f"x{var}=={required_version}"]
             create_clause_package(package_dir, i, version, dependencies)
 
+def generate_packages(num_vars: int, clauses: list, package_dir: Path):
+    """Generate all necessary wheel packages."""
+    package_dir.mkdir(exist_ok=True, parents=True)
+
+    workers = os.cpu_count() or 1
+    if workers == 1:
+        # A pool only adds overhead on a single core
+        _write_variable_packages(package_dir, range(1, num_vars + 1))
+        _write_clause_packages(package_dir, enumerate(clauses, 1))
+        return
+
+    # Wheels are independent of each other, so split them into one batch of
+    # variables and one batch of clauses per worker; leaving the with block
+    # waits for every write before the resolver runs
+    numbered_clauses = list(enumerate(clauses, 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        variable_batches = executor.map(_write_variable_packages, repeat(package_dir),
+                                        [range(k, num_vars + 1, workers) for k in range(1, workers + 1)])
+        clause_batches = executor.map(_write_clause_packages, repeat(package_dir),
+                                      [numbered_clauses[k::workers] for k in range(workers)])
+
+        # Surface any error raised while writing a wheel
+        list(chain(variable_batches, clause_batches))
+
 def parse_dimacs(dimacs_str: str):
     """Parse DIMACS CNF format into num_vars and clauses."""
     num_vars = 0
-    clauses = []
 
-    for line in dimacs_str.split('\n'):
-        # Skip empty lines, comments, problem line
-        line = line.strip()
-        if not line or line.startswith('c') or line.startswith('p') or line.startswith('%'):
-            continue
+    # Skip comments, problem line and the trailing '%' line in one pass, drop
+    # any stray '%' tokens, then convert every remaining token at once
+    nums = list(map(int, _SKIPPED_LINES.sub('', dimacs_str).replace('%', ' ').split()))
 
-        # Parse numbers until 0 or % and add as clause
-        nums = [int(x) for x in line.split() if x != '0' and x != '%']
-        if nums:  # only add if we got some numbers
-            clauses.append(nums)
+    # Every clause ends with a 0, so cut the literals at each one
+    clauses = []
+    start = 0
+    while start < len(nums):
+        try:
+            end = nums.index(0, start)
+        except ValueError:
+            end = len(nums)  # last clause is missing its 0
+        if end > start:  # only add if we got some numbers
+            clauses.append(nums[start:end])
+        start = end + 1
 
     # If num_vars wasn't specified in a 'p' line, calculate it from the clauses
     if num_vars == 0:
@@ -120,11 +179,58 @@ def parse_solution(requirements_txt: Path) -> dict[int, bool]:
 
     return assignments
 
-def solve_sat(dimacs_str: str, use_uv: bool = False) -> bool:
+def solve_with_pysat(num_vars: int, clauses: list) -> tuple[bool, Optional[dict[int, bool]]]:
+    """Solve the SAT problem directly with MiniSat through pysat, skipping the wheels.
+    Returns assignments in the same form as parse_solution."""
+    try:
+        from pysat.solvers import Minisat22
+    except ImportError:
+        raise ImportError("The pysat backend needs the python-sat package (pip install python-sat)") from None
+
+    with Minisat22(bootstrap_with=clauses) as solver:
+        if not solver.solve():
+            return False, None
+        model = solver.get_model()
+
+    # Variables that appear in no clause are reported as False, like the pip path does
+    assignments = dict.fromkeys(range(1, num_vars + 1), False)
+    assignments.update((abs(lit), lit > 0) for lit in model)
+    return True, assignments
+
+def _scratch_dir(num_wheels: int):
+    """Return SCRATCH_DIR if it has room for num_wheels wheels, otherwise None
+    so that tempfile falls back to the default temp directory."""
+    if SCRATCH_DIR is None:
+        return None
+
+    # tmpfs spends at least one block on every file, and a wheel fits in one,
+    # so a small /dev/shm (64 MB by default in Docker) can run out long before
+    # the bytes written would suggest
+    stats = os.statvfs(SCRATCH_DIR)
+    if stats.f_bavail < num_wheels + _SCRATCH_HEADROOM_BLOCKS:
+        return None
+    # Likewise every wheel needs an inode (f_files is 0 when inodes are unlimited)
+    if stats.f_files and stats.f_favail < num_wheels + _SCRATCH_HEADROOM_BLOCKS:
+        return None
+    return SCRATCH_DIR
+
+def solve_sat(dimacs_str: str, use_uv: bool = False, backend: str = "pip") -> bool:
     """Try to solve the SAT problem using pip-compile."""
     num_vars, clauses = parse_dimacs(dimacs_str)
-
-    with tempfile.TemporaryDirectory() as tmpdir:
+    return solve_clauses(num_vars, clauses, use_uv=use_uv, backend=backend)
+
+def solve_clauses(num_vars: int, clauses: list, use_uv: bool = False,
+                  backend: str = "pip") -> tuple[bool, Optional[dict[int, bool]]]:
+    """Try to solve an already parsed SAT problem using pip-compile.
+    Lets callers that build clauses themselves skip the DIMACS round trip.
+    backend="pysat" hands the clauses to MiniSat instead of pip."""
+    if backend == "pysat":
+        return solve_with_pysat(num_vars, clauses)
+    if backend != "pip":
+        raise ValueError(f"Unknown backend: {backend}")
+
+    num_wheels = 2 * num_vars + sum(map(len, clauses))
+    with tempfile.TemporaryDirectory(dir=_scratch_dir(num_wheels)) as tmpdir:
         tmpdir_path = Path(tmpdir)
         package_dir = tmpdir_path / "packages"
 
@@ -178,12 +284,14 @@ p cnf 4 3
                        type=argparse.FileType('r'),
                        help='Path to DIMACS CNF file')
     parser.add_argument('--uv', action='store_true', help='Use uv instead of pip-compile')
+    parser.add_argument('--backend', choices=['pip', 'pysat'], default='pip',
+                       help='Solve with pip (default) or directly with pysat')
 
     args = parser.parse_args()
 
     try:
         dimacs = args.input_file.read()
-        is_satisfiable, assignments = solve_sat(dimacs, use_uv=args.uv)
+        is_satisfiable, assignments = solve_sat(dimacs, use_uv=args.uv, backend=args.backend)
 
         if is_satisfiable:
             print("SATISFIABLE")